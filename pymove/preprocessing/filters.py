@@ -19,18 +19,18 @@ clean_id_by_time_max
 """
 from __future__ import annotations
 
+from logging import DEBUG
 from typing import TYPE_CHECKING, Any, Callable
 
 import numpy as np
-from pandas import DataFrame
+from pandas import DataFrame, NaT, Timestamp, isna
 
-from pymove.semantic.semantic import outliers
+from pymove.semantic.semantic import _outliers_filter
 from pymove.utils.constants import (
     DATETIME,
     DIST_TO_PREV,
     LATITUDE,
     LONGITUDE,
-    OUTLIER,
     SPEED_TO_PREV,
     TID,
     TIME_TO_PREV,
@@ -44,22 +44,24 @@ if TYPE_CHECKING:
 
 
 def get_bbox_by_radius(
-    coordinates: tuple[float, float], radius: float = 1000
-) -> tuple[float, float, float, float]:
+    coordinates: tuple[float, float] | np.ndarray, radius: float = 1000
+) -> tuple[float, float, float, float] | np.ndarray:
     """
     Defines minimum and maximum coordinates, given a distance radius from a point.
 
     Parameters
     ----------
-    coords : tuple (lat, lon)
-        The coordinates of point
+    coords : tuple (lat, lon) or array of shape (N, 2)
+        The coordinates of point, or an array with one (lat, lon) pair per row
 
     radius: float, optional (1000 by default)
 
     Returns
     -------
-    array
-        coordinates min and max of the bbox
+    tuple or array
+        coordinates min and max of the bbox, as a tuple
+        (latmin, lonmin, latmax, lonmax) for a single point,
+        or an array of shape (N, 4) with one bbox per row
 
     References
     ----------
@@ -68,7 +70,9 @@ def get_bbox_by_radius(
     earth_radius = 6371000
     r = radius / earth_radius
 
-    lat, lon = np.radians(coordinates)
+    batch = isinstance(coordinates, np.ndarray) and coordinates.ndim == 2
+    radians = np.radians(coordinates)
+    lat, lon = radians.T if batch else radians
 
     latmin = lat - r
     latmax = lat + r
@@ -78,12 +82,78 @@ def get_bbox_by_radius(
     lonmin = lon - delta_lon
     lonmax = lon + delta_lon
 
+    if batch:
+        return np.rad2deg(np.column_stack([latmin, lonmin, latmax, lonmax]))
+
     return tuple(np.rad2deg([latmin, lonmin, latmax, lonmax]))  # type: ignore
 
 
+def _filter_by_mask(
+    move_data: DataFrame,
+    filter_: Any,
+    filter_out: bool = False,
+    inplace: bool = False
+) -> DataFrame | None:
+    """
+    Selects the rows of the dataframe matching a boolean mask.
+
+    Parameters
+    ----------
+    move_data : dataframe
+        The input trajectories data
+    filter_ : array of bool
+        Boolean mask with one value per row, True for the rows to keep
+    filter_out : boolean, optional
+        If set to true, the rows not matching the mask are kept instead,
+        by default False
+    inplace : boolean, optional
+        if set to true the original dataframe will be altered to contain
+        the result of the filtering, otherwise a copy will be returned, by default False
+
+    Returns
+    -------
+    DataFrame
+        Returns dataframe with the selected rows or None
+
+    """
+    filter_ = np.asarray(filter_)
+    if filter_out:
+        filter_ = ~filter_
+
+    if inplace:
+        # the frame is only rebuilt when some row is actually removed
+        if not filter_.all():
+            move_data.drop(index=move_data.index[~filter_], inplace=True)
+        return None
+
+    return move_data[filter_]
+
+
+def _column_arrays(move_data: DataFrame, *columns: str) -> tuple[np.ndarray, ...]:
+    """
+    Returns the values of the columns as contiguous arrays.
+
+    Parameters
+    ----------
+    move_data : dataframe
+        The input trajectories data
+    *columns : str
+        Labels of the columns
+
+    Returns
+    -------
+    tuple of arrays
+        One array per column, in the given order
+
+    """
+    return tuple(
+        np.ascontiguousarray(move_data[column].values) for column in columns
+    )
+
+
 def by_bbox(
     move_data: DataFrame,
-    bbox: tuple[float, float, float, float],
+    bbox: tuple[float, float, float, float] | np.ndarray,
     filter_out: bool = False,
     inplace: bool = False
 ) -> DataFrame | None:
@@ -94,7 +164,7 @@ def by_bbox(
     ----------
     move_data : dataframe
        The input trajectories data
-    bbox : tuple
+    bbox : tuple or array
         Tuple of 4 elements, containing the minimum and maximum values
         of latitude and longitude of the bounding box.
     filter_out : boolean, optional
@@ -110,16 +180,14 @@ def by_bbox(
         Returns dataframe with trajectories points filtered by bounding box or None
 
     """
-    filter_ = (
-        (move_data[LATITUDE] >= bbox[0])
-        & (move_data[LONGITUDE] >= bbox[1])
-        & (move_data[LATITUDE] <= bbox[2])
-        & (move_data[LONGITUDE] <= bbox[3])
-    )
-    if filter_out:
-        filter_ = ~filter_
+    lat, lon = _column_arrays(move_data, LATITUDE, LONGITUDE)
 
-    return move_data.drop(index=move_data[~filter_].index, inplace=inplace)
+    # accumulates the comparisons in place on a single mask
+    filter_ = lat >= bbox[0]
+    filter_ &= lon >= bbox[1]
+    filter_ &= lat <= bbox[2]
+    filter_ &= lon <= bbox[3]
+    return _filter_by_mask(move_data, filter_, filter_out, inplace)
 
 
 def by_datetime(
@@ -155,20 +223,39 @@ def by_datetime(
         Returns dataframe with trajectories points filtered by time range or None
 
     """
-    if start_datetime is not None and end_datetime is not None:
-        filter_ = (
-            (move_data[DATETIME] >= start_datetime)
-            & (move_data[DATETIME] <= end_datetime)
-        )
+    datetime = move_data[DATETIME]
+    if datetime.is_monotonic_increasing:
+        # a sorted column only needs the positions of the range limits
+        start, end = 0, move_data.shape[0]
+        if start_datetime is not None:
+            start = datetime.searchsorted(start_datetime, side='left')
+        if end_datetime is not None:
+            end = datetime.searchsorted(end_datetime, side='right')
+        filter_ = np.zeros(move_data.shape[0], dtype=bool)
+        filter_[start:end] = True
+    elif datetime.dtype == 'datetime64[ns]' and all(
+        Timestamp(limit) is not NaT and Timestamp(limit).tz is None
+        for limit in (start_datetime, end_datetime) if limit is not None
+    ):
+        # compares the nanoseconds directly, NaT is below any lower limit,
+        # tz-aware or missing limits are left to the pandas comparison
+        values = _column_arrays(move_data, DATETIME)[0].view(np.int64)
+        lower = np.iinfo(np.int64).min + 1
+        upper = np.iinfo(np.int64).max
+        if start_datetime is not None:
+            lower = Timestamp(start_datetime).value
+        if end_datetime is not None:
+            upper = Timestamp(end_datetime).value
+        filter_ = values >= lower
+        filter_ &= values <= upper
+    elif start_datetime is not None and end_datetime is not None:
+        filter_ = (datetime >= start_datetime) & (datetime <= end_datetime)
     elif end_datetime is not None:
-        filter_ = move_data[DATETIME] <= end_datetime
+        filter_ = datetime <= end_datetime
     else:
-        filter_ = move_data[DATETIME] >= start_datetime
-
-    if filter_out:
-        filter_ = ~filter_
+        filter_ = datetime >= start_datetime
 
-    return move_data.drop(index=move_data[~filter_].index, inplace=inplace)
+    return _filter_by_mask(move_data, filter_, filter_out, inplace)
 
 
 def by_label(
@@ -204,11 +291,10 @@ def by_label(
         Returns dataframe with trajectories points filtered by label or None
 
     """
-    filter_ = move_data[label_name] == value
-    if filter_out:
-        filter_ = ~filter_
+    # comparing on the backing array skips the index alignment of a Series
+    filter_ = move_data[label_name].array == value
 
-    return move_data.drop(index=move_data[~filter_].index, inplace=inplace)
+    return _filter_by_mask(move_data, filter_, filter_out, inplace)
 
 
 def by_id(
@@ -321,21 +407,38 @@ def clean_consecutive_duplicates(
         The filtered trajectories points without consecutive duplicates or None
 
     """
-    if keep == 'first':
-        n = 1
-    else:
-        n = -1
     if subset is None:
-        filter_ = (move_data.shift(n) != move_data).any(axis=1)
+        columns = move_data.columns
+    elif isinstance(subset, (int, str)):
+        columns = [subset]
     else:
-        filter_ = (move_data[subset].shift(n) != move_data[subset]).any(axis=1)
+        columns = subset
 
-    return move_data.drop(index=move_data[~filter_].index, inplace=inplace)
+    # compares each row with its neighbour column by column,
+    # without building a shifted copy of the dataframe
+    filter_ = np.zeros(move_data.shape[0], dtype=bool)
+    if keep == 'first':
+        filter_[:1] = True
+    else:
+        filter_[-1:] = True
+    for column in columns:
+        values = move_data[column].to_numpy()
+        # missing values always count as changed, as in DataFrame.ne
+        missing = isna(values)
+        changed = missing[1:] | missing[:-1]
+        present = ~changed
+        changed[present] = values[1:][present] != values[:-1][present]
+        if keep == 'first':
+            filter_[1:] |= changed
+        else:
+            filter_[:-1] |= changed
+
+    return _filter_by_mask(move_data, filter_, inplace=inplace)
 
 
 def _filter_single_by_max(move_data: DataFrame, **kwargs):
     """
-    Filters from a dataframe rows with features below value.
+    Selects from a dataframe rows with features below value.
 
     Parameters
     ----------
@@ -347,16 +450,17 @@ def _filter_single_by_max(move_data: DataFrame, **kwargs):
 
     Returns
     -------
-    DataFrame
-        Filtered dataframe.
+    array of bool
+        Mask of the selected rows.
 
     """
-    return move_data[move_data[kwargs['arg1']] <= kwargs['arg2']]
+    values = _column_arrays(move_data, kwargs['arg1'])[0]
+    return values <= kwargs['arg2']
 
 
 def _filter_speed_max_radius(move_data: DataFrame, **kwargs):
     """
-    Filters from a dataframe rows with current or previous row features exceeding value.
+    Selects from a dataframe rows with current or previous row features exceeding value.
 
     Parameters
     ----------
@@ -368,15 +472,22 @@ def _filter_speed_max_radius(move_data: DataFrame, **kwargs):
 
     Returns
     -------
-    DataFrame
-        Filtered dataframe.
+    array of bool
+        Mask of the selected rows.
 
     """
-    filter_ = (
-        (np.nan_to_num(move_data[kwargs['arg1']].shift(1)) > kwargs['arg2'])
-        | (np.nan_to_num(move_data[kwargs['arg1']]) > kwargs['arg2'])
-    )
-    return move_data[filter_]
+    values = _column_arrays(move_data, kwargs['arg1'])[0]
+    limit = kwargs['arg2']
+    # missing features, including the one before the first row, count as zero
+    if limit < 0:
+        exceeded = ~(values <= limit)
+    else:
+        exceeded = values > limit
+
+    filter_ = exceeded.copy()
+    filter_[:1] |= limit < 0
+    filter_[1:] |= exceeded[:-1]
+    return filter_
 
 
 def _filter_data(move_data: DataFrame, f: Callable, kwargs: dict):
@@ -396,29 +507,27 @@ def _filter_data(move_data: DataFrame, f: Callable, kwargs: dict):
 
     Returns
     -------
-    dataframe
-        Filtered dataframe.
+    array of bool
+        Mask of the rows to be dropped.
     int
         Number of rows to be dropped
 
     """
     if kwargs['outliers']:
-        filter_data_points = f(
+        filter_ = f(
             move_data,
             jump_coefficient=kwargs['arg1'],
             threshold=kwargs['arg2'],
-            inplace=False
-        )
-        filter_data_points = filter_data_points[filter_data_points[OUTLIER]]
+        ).values
     else:
-        filter_data_points = f(
+        filter_ = f(
             move_data,
             arg1=kwargs['arg1'],
             arg2=kwargs['arg2'],
             inplace=False
         )
-    rows_to_drop = filter_data_points.shape[0]
-    return filter_data_points, rows_to_drop
+    rows_to_drop = int(filter_.sum())
+    return filter_, rows_to_drop
 
 
 def _clean_gps(move_data: DataFrame, f: Callable, **kwargs):
@@ -446,22 +555,20 @@ def _clean_gps(move_data: DataFrame, f: Callable, **kwargs):
         logger.debug('...Reset index for filtering\n')
         move_data.reset_index(inplace=True)
 
-    filter_data_points, rows_to_drop = _filter_data(move_data, f, kwargs)
+    # the filters only read features that are not updated after the drop,
+    # so a single pass already removes every point the condition selects
+    filter_, rows_to_drop = _filter_data(move_data, f, kwargs)
 
-    sum_drop = 0
-    while rows_to_drop > 0:
-        logger.debug('...Dropping %s rows of gps points\n' % rows_to_drop)
+    if rows_to_drop > 0:
+        logger.debug('...Dropping %s rows of gps points\n', rows_to_drop)
         shape_before = move_data.shape[0]
-        move_data.drop(index=filter_data_points.index, inplace=True)
-        sum_drop = sum_drop + rows_to_drop
+        move_data.drop(index=move_data.index[filter_], inplace=True)
         logger.debug(
-            '...Rows before: %s, Rows after:%s, Sum drop:%s\n'
-            % (shape_before, move_data.shape[0], sum_drop)
+            '...Rows before: %s, Rows after:%s\n',
+            shape_before, move_data.shape[0]
         )
 
-        filter_data_points, rows_to_drop = _filter_data(move_data, f, kwargs)
-
-    logger.debug('%s GPS points were dropped' % sum_drop)
+    logger.debug('%s GPS points were dropped', rows_to_drop)
 
     return move_data
 
@@ -509,12 +616,12 @@ def clean_gps_jumps_by_distance(
         )
 
     logger.debug(
-        '\nCleaning gps jumps by distance to jump_coefficient %s...\n'
-        % jump_coefficient
+        '\nCleaning gps jumps by distance to jump_coefficient %s...\n',
+        jump_coefficient
     )
     move_data = _clean_gps(
         move_data,
-        outliers,
+        _outliers_filter,
         arg1=jump_coefficient,
         arg2=threshold,
         outliers=True
@@ -564,8 +671,8 @@ def clean_gps_nearby_points_by_distances(
         )
 
     logger.debug(
-        '\nCleaning gps points from radius of %s meters\n'
-        % radius_area
+        '\nCleaning gps points from radius of %s meters\n',
+        radius_area
     )
 
     move_data = _clean_gps(
@@ -619,8 +726,8 @@ def clean_gps_nearby_points_by_speed(
         )
 
     logger.debug(
-        '\nCleaning gps points using %s speed radius\n'
-        % speed_radius
+        '\nCleaning gps points using %s speed radius\n',
+        speed_radius
     )
 
     move_data = _clean_gps(
@@ -648,10 +755,8 @@ def clean_gps_speed_max_radius(
     be removed if one of the following happens: if the travel speed from the
     point before p to p is greater than the  max value of speed between adjacent
     points set by the user. Or the travel speed between point p and the next
-    point is greater than the value set by the user. When the cleaning is done,
-    the function will update the time and distance features in the dataframe and
-    will call itself again. The function will finish processing when it can no
-    longer find points disrespecting the limit of speed.
+    point is greater than the value set by the user. The points are removed in a
+    single pass, using the speed features already present in the dataframe.
 
     Parameters
     ----------
@@ -683,8 +788,8 @@ def clean_gps_speed_max_radius(
         )
 
     logger.debug(
-        '\nClean gps points with speed max > %s meters by seconds'
-        % speed_max
+        '\nClean gps points with speed max > %s meters by seconds',
+        speed_max
     )
 
     move_data = _clean_gps(
@@ -738,37 +843,35 @@ def clean_trajectories_with_few_points(
         raise KeyError('%s not in dataframe' % label_tid)
 
     logger.debug(
-        '\nCleaning gps points from trajectories of fewer than %s points\n'
-        % min_points_per_trajectory
+        '\nCleaning gps points from trajectories of fewer than %s points\n',
+        min_points_per_trajectory
     )
 
     if move_data.index.name is not None:
         logger.debug('\n...Reset index for filtering\n')
         move_data.reset_index(inplace=True)
 
-    move_datacount_tid = move_data.groupby(by=label_tid).size()
-    filter_ = move_datacount_tid < min_points_per_trajectory
-    tids_with_few_points = move_datacount_tid[filter_].index
+    # broadcasts the size of each trajectory back to its points
+    count_tid = (
+        move_data.groupby(by=label_tid, sort=False)[label_tid].transform('size')
+    )
+    filter_ = (count_tid < min_points_per_trajectory).values
     shape_before_drop = move_data.shape
-    idx = move_data[move_data[label_tid].isin(tids_with_few_points)].index
 
-    if idx.shape[0] > 0:
-        logger.debug(
-            '\n...There are %s ids with few points'
-            % tids_with_few_points.shape[0]
-        )
-        logger.debug(
-            '\n...Tids before drop: %s'
-            % move_data[label_tid].unique().shape[0]
-        )
-        move_data.drop(index=idx, inplace=True)
-        logger.debug(
-            '\n...Tids after drop: %s'
-            % move_data[label_tid].unique().shape[0]
-        )
+    if filter_.any():
+        if logger.isEnabledFor(DEBUG):
+            # whole trajectories are dropped, so the ids are counted only once
+            tids_to_drop = move_data.loc[filter_, label_tid].nunique()
+            tids_before_drop = move_data[label_tid].unique().shape[0]
+            logger.debug('\n...There are %s ids with few points', tids_to_drop)
+            logger.debug('\n...Tids before drop: %s', tids_before_drop)
+            logger.debug(
+                '\n...Tids after drop: %s', tids_before_drop - tids_to_drop
+            )
+        move_data.drop(index=move_data.index[filter_], inplace=True)
         logger.debug(
-            '\n...Shape - before drop: %s - after drop: %s'
-            % (shape_before_drop, move_data.shape)
+            '\n...Shape - before drop: %s - after drop: %s',
+            shape_before_drop, move_data.shape
         )
 
     if not inplace:
@@ -833,30 +936,33 @@ def clean_trajectories_short_and_few_points(
         logger.debug('reseting index')
         move_data.reset_index(inplace=True)
 
-    move_dataagg_tid = move_data.groupby(by=label_id).agg(
-        {DIST_TO_PREV: 'sum'}
+    # broadcasts the length of each trajectory back to its points
+    dist_tid = (
+        move_data.groupby(by=label_id, sort=False)[DIST_TO_PREV].transform('sum')
     )
-    filter_ = move_dataagg_tid[DIST_TO_PREV] < min_trajectory_distance
-    tid_selection = move_dataagg_tid[filter_].index
-
-    logger.debug(
-        '\n...short trajectories and trajectories with a minimum distance (%s): %s'
-        % (move_dataagg_tid.shape[0], min_trajectory_distance)
-    )
-    logger.debug('\n...There are %s tid do drop' % tid_selection.shape[0])
-    shape_before_drop = move_data.shape
+    filter_ = (dist_tid < min_trajectory_distance).values
 
-    idx = move_data[move_data[label_id].isin(tid_selection)].index
-    if idx.shape[0] > 0:
+    if logger.isEnabledFor(DEBUG):
+        # whole trajectories are dropped, so the ids are counted only once
+        tids_to_drop = move_data.loc[filter_, label_id].nunique()
         tids_before_drop = move_data[label_id].unique().shape[0]
         logger.debug(
-            '\n...Tids - before drop: %s - after drop: %s'
-            % (tids_before_drop, move_data[label_id].unique().shape[0])
+            '\n...short trajectories and trajectories with a minimum distance (%s): %s',
+            tids_before_drop, min_trajectory_distance
         )
-        move_data.drop(index=idx, inplace=True)
+        logger.debug('\n...There are %s tid do drop', tids_to_drop)
+    shape_before_drop = move_data.shape
+
+    if filter_.any():
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(
+                '\n...Tids - before drop: %s - after drop: %s',
+                tids_before_drop, tids_before_drop - tids_to_drop
+            )
+        move_data.drop(index=move_data.index[filter_], inplace=True)
         logger.debug(
-            '\n...Shape - before drop: %s - after drop: %s'
-            % (shape_before_drop, move_data.shape)
+            '\n...Shape - before drop: %s - after drop: %s',
+            shape_before_drop, move_data.shape
         )
 
     if not inplace:
@@ -904,29 +1010,26 @@ def clean_id_by_time_max(
         )
 
     logger.debug(
-        '\nClean gps points with time max by id < %s seconds'
-        % time_max
+        '\nClean gps points with time max by id < %s seconds',
+        time_max
     )
-    move_dataid_drop = (
-        move_data.groupby([label_id], as_index=False)
-        .agg({TIME_TO_PREV: 'sum'})
-        .query(f'{TIME_TO_PREV} < {time_max}')
+    # broadcasts the duration of each trajectory back to its points
+    time_id = (
+        move_data.groupby(by=label_id, sort=False)[TIME_TO_PREV].transform('sum')
     )
-    logger.debug(
-        '...Ids total: %s\nIds to drop:%s'
-        % (
+    filter_ = (time_id < time_max).values
+    if logger.isEnabledFor(DEBUG):
+        logger.debug(
+            '...Ids total: %s\nIds to drop:%s',
             move_data[label_id].nunique(),
-            move_dataid_drop[label_id].nunique()
+            move_data.loc[filter_, label_id].nunique()
         )
-    )
-    if move_dataid_drop.shape[0] > 0:
+    if filter_.any():
         before_drop = move_data.shape[0]
-        filter_ = move_data[label_id].isin(move_dataid_drop[label_id])
-        idx = move_data[filter_].index
-        move_data.drop(idx, inplace=True)
+        move_data.drop(index=move_data.index[filter_], inplace=True)
         logger.debug(
-            '...Rows before drop: %s\n Rows after drop: %s'
-            % (before_drop, move_data.shape[0])
+            '...Rows before drop: %s\n Rows after drop: %s',
+            before_drop, move_data.shape[0]
         )
 
     if not inplace:
@@ -9,11 +9,434 @@ from __future__ import annotations
 
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from numpy import ndarray
 from pandas import DataFrame
+from scipy.spatial.distance import cdist
+from sklearn.neighbors import KDTree
 
-from pymove.utils import distances
+from pymove.core.pandas import PandasMoveDataFrame
 from pymove.utils.constants import DATETIME, LATITUDE, LONGITUDE, MEDP, MEDT, TRAJ_ID
-from pymove.utils.log import logger, progress_bar
+from pymove.utils.log import logger
+
+_BLOCK_SIZE = 1 << 20
+
+
+def _concat_trajectories(
+    traj: DataFrame, selected: DataFrame, with_traj: bool = False
+) -> DataFrame:
+    """
+    Appends the selected trajectories to the query trajectory.
+
+    Parameters
+    ----------
+    traj: dataframe
+        The input of one trajectory, used as the template of the result.
+    selected: dataframe
+        The points of the selected trajectories.
+    with_traj: bool, optional
+        Whether the points of traj start the result,
+        otherwise only its columns are kept, by default False
+
+    Returns
+    -------
+    DataFrame
+        dataframe with the selected trajectories, with the same type as traj
+
+    """
+    head = traj if with_traj else traj.iloc[0:0]
+    result = pd.concat([head, selected], copy=False)
+    if isinstance(traj, PandasMoveDataFrame):
+        result = PandasMoveDataFrame(result)
+    return result
+
+
+def _trajectory_groups(
+    move_df: DataFrame, id_: str
+) -> tuple[ndarray, ndarray, ndarray]:
+    """
+    Groups the points of move_df by trajectory.
+
+    Trajectories are kept in the order in which their ids first appear.
+
+    Parameters
+    ----------
+    move_df: dataframe
+        The input trajectory data.
+    id_: str
+        Label of the trajectories dataframe user id
+
+    Returns
+    -------
+    ndarray
+        ids of the trajectories
+    ndarray
+        positions of the points, grouped by trajectory
+    ndarray
+        index in the positions of the first point of each trajectory
+
+    """
+    codes, ids = pd.factorize(move_df[id_])
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    starts = np.searchsorted(codes[order], np.arange(len(ids)))
+    return np.asarray(ids), order, starts
+
+
+def _trajectory_points(
+    move_df: DataFrame,
+    latitude: str,
+    longitude: str,
+    datetime: str | None = None
+) -> ndarray:
+    """
+    Returns the coordinates of the points as a float array.
+
+    Parameters
+    ----------
+    move_df: dataframe
+        The input trajectory data.
+    latitude: string
+        Label of the trajectories dataframe referring to the latitude
+    longitude: string
+        Label of the trajectories dataframe referring to the longitude
+    datetime: string, optional
+        Label of the trajectories dataframe referring to the timestamp,
+        if given the time in milliseconds / 1e9 is added as third column,
+        by default None
+
+    Returns
+    -------
+    ndarray
+        array with one row per point
+
+    """
+    columns = [
+        np.asarray(move_df[latitude], dtype=float),
+        np.asarray(move_df[longitude], dtype=float)
+    ]
+    if datetime is not None:
+        times = move_df[datetime]
+        if times.dtype != 'datetime64[ns]':
+            times = pd.to_datetime(times)
+        nanos = times.values.view(np.int64)
+        columns.append((nanos // 1000000) / 1000000000)
+    return np.column_stack(columns)
+
+
+def _medp(traj_points: ndarray, points: ndarray, starts: ndarray) -> ndarray:
+    """
+    Returns the MEDP distance from one trajectory to each of the others.
+
+    Same measure as pymove.utils.distances.medp, computed for all
+    trajectories at once with a segmented minimum over their points.
+
+    Parameters
+    ----------
+    traj_points: ndarray
+        Latitude and longitude of the points of the query trajectory.
+    points: ndarray
+        Latitude and longitude of the points of the candidates,
+        grouped by trajectory.
+    starts: ndarray
+        Index in points of the first point of each candidate.
+
+    Returns
+    -------
+    ndarray
+        distance to each candidate
+
+    """
+    result = np.zeros(len(starts))
+    if len(starts) == 0:
+        return result
+    step = max(1, _BLOCK_SIZE // len(points))
+    for first in range(0, len(traj_points), step):
+        dists = cdist(traj_points[first:first + step], points)
+        result += np.minimum.reduceat(dists, starts, axis=1).sum(axis=0)
+    return result
+
+
+def _medt(traj_points: ndarray, points: ndarray, starts: ndarray) -> ndarray:
+    """
+    Returns the MEDT distance from one trajectory to each of the others.
+
+    Same measure as pymove.utils.distances.medt, computed for all
+    trajectories at once with weighted counts over their points.
+
+    Parameters
+    ----------
+    traj_points: ndarray
+        Latitude, longitude and time of the points of the query trajectory.
+    points: ndarray
+        Latitude, longitude and time of the points of the candidates,
+        grouped by trajectory.
+    starts: ndarray
+        Index in points of the first point of each candidate.
+
+    Returns
+    -------
+    ndarray
+        distance to each candidate
+
+    """
+    if len(starts) == 0:
+        return np.zeros(0)
+    size = len(traj_points)
+    lengths = np.diff(np.append(starts, len(points)))
+    labels = np.repeat(np.arange(len(starts)), lengths)
+    index = np.arange(len(points)) - np.repeat(starts, lengths)
+
+    paired = index < size
+    dists = np.sqrt(
+        ((points[paired] - traj_points[index[paired]]) ** 2).sum(axis=1)
+    )
+    result = np.bincount(labels[paired], weights=dists, minlength=len(starts))
+
+    # time of the points left in the longer trajectory, skipping the first one
+    tail = index > size
+    result += np.bincount(
+        labels[tail], weights=points[tail, 2], minlength=len(starts)
+    )
+    traj_tail = np.append(np.cumsum(traj_points[::-1, 2])[::-1], [0, 0])
+    shorter = lengths < size
+    result[shorter] += traj_tail[lengths[shorter] + 1]
+    return result
+
+
+# kernel of each distance measure and whether it uses the timestamps
+_DIST_KERNELS = {MEDP: (_medp, False), MEDT: (_medt, True)}
+
+
+def _medp_candidates(
+    traj_points: ndarray,
+    points: ndarray,
+    starts: ndarray,
+    selected: ndarray,
+    max_dist: float
+) -> ndarray:
+    """
+    Filters the trajectories without points near the query for MEDP.
+
+    MEDP adds the distance from each point of the query trajectory to the
+    nearest point of the other one, so a trajectory can only be closer than
+    max_dist if every point of the query has one of its points within max_dist.
+
+    Parameters
+    ----------
+    traj_points: ndarray
+        Latitude and longitude of the points of the query trajectory.
+    points: ndarray
+        Latitude and longitude of the points of the selected trajectories,
+        grouped by trajectory.
+    starts: ndarray
+        Index in points of the first point of each selected trajectory.
+    selected: ndarray
+        Indexes of the selected trajectories.
+    max_dist: float
+        Distance threshold.
+
+    Returns
+    -------
+    ndarray
+        indexes of the selected trajectories that may be closer than max_dist
+
+    """
+    if len(selected) == 0:
+        return selected
+    # when the radius covers the whole extent of the data every point is
+    # near every query point and the search can not discard anything
+    extent = np.vstack([traj_points, points])
+    if max_dist >= np.linalg.norm(extent.max(axis=0) - extent.min(axis=0)):
+        return selected
+
+    lengths = np.diff(np.append(starts, len(points)))
+    labels = np.repeat(np.arange(len(selected)), lengths)
+    near_all = np.ones(len(selected), dtype=bool)
+    tree = KDTree(points)
+    step = max(1, _BLOCK_SIZE // len(points))
+    for first in range(0, len(traj_points), step):
+        block = traj_points[first:first + step]
+        for near in tree.query_radius(block, r=max_dist):
+            seen = np.zeros(len(selected), dtype=bool)
+            seen[labels[near]] = True
+            near_all &= seen
+        if not near_all.any():
+            break
+    return selected[near_all]
+
+
+def _trajectory_rows(
+    order: ndarray, starts: ndarray, selected: ndarray
+) -> tuple[ndarray, ndarray]:
+    """
+    Returns the positions of the points of the selected trajectories.
+
+    Parameters
+    ----------
+    order: ndarray
+        Positions of the points, grouped by trajectory.
+    starts: ndarray
+        Index in order of the first point of each trajectory.
+    selected: ndarray
+        Indexes of the selected trajectories, in the order of the result.
+
+    Returns
+    -------
+    ndarray
+        positions of the points, grouped by selected trajectory
+    ndarray
+        index in the result of the first point of each selected trajectory
+
+    """
+    lengths = np.diff(np.append(starts, len(order)))[selected]
+    first = np.cumsum(lengths) - lengths
+    index = np.arange(lengths.sum()) + np.repeat(starts[selected] - first, lengths)
+    return order[index], first
+
+
+def _medp_bbox_candidates(
+    traj_points: ndarray,
+    points: ndarray,
+    starts: ndarray,
+    selected: ndarray,
+    max_dist: float
+) -> ndarray:
+    """
+    Filters the trajectories whose bounding box is too far for MEDP.
+
+    The distance from a point to the bounding box of a trajectory is never
+    larger than the distance to its nearest point, so adding it over the
+    points of the query trajectory gives a lower bound of MEDP.
+
+    Parameters
+    ----------
+    traj_points: ndarray
+        Latitude and longitude of the points of the query trajectory.
+    points: ndarray
+        Latitude and longitude of the points of the selected trajectories,
+        grouped by trajectory.
+    starts: ndarray
+        Index in points of the first point of each selected trajectory.
+    selected: ndarray
+        Indexes of the selected trajectories.
+    max_dist: float
+        Distance threshold.
+
+    Returns
+    -------
+    ndarray
+        indexes of the selected trajectories that may be closer than max_dist
+
+    """
+    if len(selected) == 0:
+        return selected
+    lower = np.minimum.reduceat(points, starts, axis=0)
+    upper = np.maximum.reduceat(points, starts, axis=0)
+    bound = np.zeros(len(selected))
+    step = max(1, _BLOCK_SIZE // len(selected))
+    for first in range(0, len(traj_points), step):
+        block = traj_points[first:first + step, np.newaxis]
+        gap = np.maximum(np.maximum(lower - block, block - upper), 0)
+        bound += np.sqrt((gap ** 2).sum(axis=2)).sum(axis=0)
+    # a small tolerance keeps rounding in the sums from dropping a
+    # trajectory that is right at the limit
+    return selected[bound <= max_dist * (1 + 1e-9)]
+
+
+def _query_distances(
+    traj: DataFrame,
+    move_df: DataFrame,
+    id_: str,
+    distance: str,
+    latitude: str,
+    longitude: str,
+    datetime: str,
+    max_dist: float | None = None,
+    n_jobs: int = 1
+) -> tuple[ndarray, ndarray, ndarray, ndarray]:
+    """
+    Computes the distance from the trajectory to each trajectory in move_df.
+
+    Parameters
+    ----------
+    traj: dataframe
+        The input of one trajectory.
+    move_df: dataframe
+        The input trajectory data.
+    id_: str
+        Label of the trajectories dataframe user id
+    distance: string
+        Distance measure type
+    latitude: string
+        Label of the trajectories dataframe referring to the latitude
+    longitude: string
+        Label of the trajectories dataframe referring to the longitude
+    datetime: string
+        Label of the trajectories dataframe referring to the timestamp
+    max_dist: float, optional
+        If given, trajectories that can not be closer than max_dist
+        may be skipped, with their distance set to inf, by default None
+    n_jobs: int, optional
+        Number of threads computing the distances, by default 1
+
+    Returns
+    -------
+    ndarray
+        ids of the trajectories
+    ndarray
+        positions of the points, grouped by trajectory
+    ndarray
+        index in the positions of the first point of each trajectory
+    ndarray
+        distance to each trajectory
+
+    Raises
+    ------
+        ValueError: if distance measure is invalid
+
+    """
+    try:
+        dist_measure, with_time = _DIST_KERNELS[distance]
+    except KeyError:
+        raise ValueError('Unknown distance measure. Use MEDP or MEDT')
+    time_label = datetime if with_time else None
+
+    ids, order, starts = _trajectory_groups(move_df, id_)
+    traj_points = _trajectory_points(traj, latitude, longitude, time_label)
+    points = _trajectory_points(move_df, latitude, longitude, time_label)
+
+    selected = np.arange(len(ids))
+    if (
+        max_dist is not None
+        and dist_measure is _medp
+        and len(selected) > 0
+        and len(traj_points) > 0
+        and max_dist >= 0
+        and np.isfinite(points).all()
+        and np.isfinite(traj_points).all()
+    ):
+        rows, first = _trajectory_rows(order, starts, selected)
+        selected = _medp_bbox_candidates(
+            traj_points, points[rows], first, selected, max_dist
+        )
+        rows, first = _trajectory_rows(order, starts, selected)
+        selected = _medp_candidates(
+            traj_points, points[rows], first, selected, max_dist
+        )
+
+    dists = np.full(len(ids), np.inf)
+    chunks = np.array_split(
+        selected, min(effective_n_jobs(n_jobs), max(len(selected), 1))
+    )
+    results = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(dist_measure)(traj_points, points[rows], first)
+        for rows, first in (
+            _trajectory_rows(order, starts, chunk) for chunk in chunks
+        )
+    )
+    dists[selected] = np.concatenate(results)
+    return ids, order, starts, dists
 
 
 def range_query(
@@ -24,7 +447,8 @@ def range_query(
     distance: str = MEDP,
     latitude: str = LATITUDE,
     longitude: str = LONGITUDE,
-    datetime: str = DATETIME
+    datetime: str = DATETIME,
+    n_jobs: int = 1
 ) -> DataFrame:
     """
     Returns all trajectories that have a distance equal to or less than the trajectory.
@@ -52,6 +476,9 @@ def range_query(
     datetime: string, optional
         Label of the trajectories dataframe referring to the timestamp,
         by default DATETIME
+    n_jobs: int, optional
+        Number of threads computing the distances, -1 uses all processors,
+        by default 1
 
     Returns
     -------
@@ -63,30 +490,13 @@ def range_query(
         ValueError: if distance measure is invalid
 
     """
-    result = traj.copy()
-    result.drop(result.index, inplace=True)
-
-    if (distance == MEDP):
-        def dist_measure(traj, this, latitude, longitude, datetime):
-            return distances.medp(
-                traj, this, latitude, longitude
-            )
-    elif (distance == MEDT):
-        def dist_measure(traj, this, latitude, longitude, datetime):
-            return distances.medt(
-                traj, this, latitude, longitude, datetime
-            )
-    else:
-        raise ValueError('Unknown distance measure. Use MEDP or MEDT')
+    _, order, starts, dists = _query_distances(
+        traj, move_df, _id, distance, latitude, longitude, datetime,
+        max_dist=min_dist, n_jobs=n_jobs
+    )
+    rows, _ = _trajectory_rows(order, starts, np.flatnonzero(dists < min_dist))
 
-    for traj_id in progress_bar(
-        move_df[_id].unique(), desc=f'Querying range by {distance}'
-    ):
-        this = move_df.loc[move_df[_id] == traj_id]
-        if dist_measure(traj, this, latitude, longitude, datetime) < min_dist:
-            result = result.append(this)
-
-    return result
+    return _concat_trajectories(traj, move_df.take(rows))
 
 
 def knn_query(
@@ -97,7 +507,8 @@ def knn_query(
     distance: str = MEDP,
     latitude: str = LATITUDE,
     longitude: str = LONGITUDE,
-    datetime: str = DATETIME
+    datetime: str = DATETIME,
+    n_jobs: int = 1
 ) -> DataFrame:
     """
     Returns the k neighboring trajectories closest to the trajectory.
@@ -125,6 +536,9 @@ def knn_query(
     datetime: string, optional
         Label of the trajectories dataframe referring to the timestamp,
         by default DATETIME
+    n_jobs: int, optional
+        Number of threads computing the distances, -1 uses all processors,
+        by default 1
 
     Returns
     -------
@@ -137,42 +551,19 @@ def knn_query(
         ValueError: if distance measure is invalid
 
     """
-    k_list = pd.DataFrame([[np.Inf, 'empty']] * k, columns=['distance', TRAJ_ID])
+    ids, order, starts, dists = _query_distances(
+        traj, move_df, id_, distance, latitude, longitude, datetime,
+        n_jobs=n_jobs
+    )
 
-    if (distance == MEDP):
-        def dist_measure(traj, this, latitude, longitude, datetime):
-            return distances.medp(
-                traj, this, latitude, longitude
-            )
-    elif (distance == MEDT):
-        def dist_measure(traj, this, latitude, longitude, datetime):
-            return distances.medt(
-                traj, this, latitude, longitude, datetime
-            )
-    else:
-        raise ValueError('Unknown distance measure. Use MEDP or MEDT')
+    candidates = np.flatnonzero(ids != traj[id_].iat[0])
+    if k < len(candidates):
+        candidates = np.sort(
+            candidates[np.argpartition(dists[candidates], k)[:k]]
+        )
+    nearest = candidates[np.argsort(dists[candidates], kind='stable')]
 
-    for traj_id in progress_bar(
-        move_df[id_].unique(), desc=f'Querying knn by {distance}'
-    ):
-        if (traj_id != traj[id_].values[0]):
-            this = move_df.loc[move_df[id_] == traj_id]
-            this_distance = dist_measure(
-                traj, this, latitude, longitude, datetime
-            )
-            n = 0
-            for n in range(k):
-                if (this_distance < k_list.loc[n, 'distance']):
-                    k_list.loc[n, 'distance'] = this_distance
-                    k_list.loc[n, 'traj_id'] = traj_id
-                    break
-                n = n + 1
-
-    result = traj.copy()
     logger.debug('Generating DataFrame with k nearest trajectories.')
-    for n in range(k):
-        result = result.append(
-            move_df.loc[move_df[id_] == k_list.loc[n, 'traj_id']]
-        )
+    rows, _ = _trajectory_rows(order, starts, nearest)
 
-    return result
+    return _concat_trajectories(traj, move_df.take(rows), with_traj=True)
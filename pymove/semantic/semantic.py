@@ -17,7 +17,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 import numpy as np
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
 from pymove.preprocessing import filters, segmentation, stay_point_detection
 from pymove.utils.constants import (
@@ -107,6 +107,38 @@ def _process_simple_filter(
     )
 
 
+def _outliers_filter(
+    move_data: DataFrame, jump_coefficient: float, threshold: float
+) -> Series:
+    """
+    Detects the points that are outliers based on the distance features.
+
+    Parameters
+    ----------
+    move_data: dataframe
+        The input trajectories data, with the distance features.
+    jump_coefficient : float
+        Coefficient applied to the distance from the previous to the next point
+    threshold : float
+        Minimum value that the distance features must have
+        in order to be considered outliers
+
+    Returns
+    -------
+    Series
+        Boolean mask of the outliers
+
+    """
+    jump = jump_coefficient * move_data[DIST_PREV_TO_NEXT]
+    return (
+        (move_data[DIST_TO_NEXT] > threshold)
+        & (move_data[DIST_TO_PREV] > threshold)
+        & (move_data[DIST_PREV_TO_NEXT] > threshold)
+        & (jump < move_data[DIST_TO_NEXT])
+        & (jump < move_data[DIST_TO_PREV])
+    )
+
+
 @timer_decorator
 def outliers(
     move_data: 'PandasMoveDataFrame' | 'DaskMoveDataFrame',
@@ -155,15 +187,9 @@ def outliers(
         and DIST_TO_NEXT
         and DIST_PREV_TO_NEXT in move_data
     ):
-        jump = jump_coefficient * move_data[DIST_PREV_TO_NEXT]
-        filter_ = (
-            (move_data[DIST_TO_NEXT] > threshold)
-            & (move_data[DIST_TO_PREV] > threshold)
-            & (move_data[DIST_PREV_TO_NEXT] > threshold)
-            & (jump < move_data[DIST_TO_NEXT])
-            & (jump < move_data[DIST_TO_PREV])
+        move_data[new_label] = _outliers_filter(
+            move_data, jump_coefficient, threshold
         )
-        move_data[new_label] = filter_
     else:
         logger.warning('...Distances features were not created')
 
@@ -1,4 +1,4 @@
-from numpy import nan
+from numpy import array, nan
 from numpy.testing import assert_array_almost_equal
 from pandas import DataFrame, Timestamp
 from pandas.testing import assert_frame_equal
@@ -185,6 +185,22 @@ def test_get_bbox_by_radius():
     assert_array_almost_equal(bbox, bbox_expected)
 
 
+def test_get_bbox_by_radius_array():
+    coordinates = array([
+        [39.984092712402344, 116.31923675537101],
+        [39.984222412109375, 116.31940460205078],
+    ])
+
+    bbox = filters.get_bbox_by_radius(coordinates)
+
+    bbox_expected = [
+        [39.9750995, 116.30749968, 39.99308593, 116.33097383],
+        [39.9752292, 116.3076675, 39.99321563, 116.3311417],
+    ]
+
+    assert_array_almost_equal(bbox, bbox_expected)
+
+
 def test_by_bbox():
     move_df, cols = _prepare_df_default(list_data_1)
     bbox = (39.984193, 116.31924, 39.984222, 116.319405)
@@ -383,6 +399,55 @@ def test_by_datetime():
     assert move_df.len() == 2
 
 
+def test_by_datetime_unsorted():
+    move_df, cols = _prepare_df_default(list_data_3)
+
+    filter_values = filters.by_datetime(
+        move_df,
+        start_datetime='2008-10-23 05:53:06',
+        end_datetime='2008-10-23 05:55:16',
+    )
+    expected = DataFrame(
+        data=[
+            [39.984200, 116.319321, Timestamp('2008-10-23 05:54:06'), 1],
+            [39.984222, 116.319405, Timestamp('2008-10-23 05:55:16'), 1],
+            [39.984199, 116.319320, Timestamp('2008-10-23 05:53:06'), 2],
+            [39.974222, 116.339404, Timestamp('2008-10-23 05:53:11'), 2],
+        ],
+        columns=cols,
+        index=[1, 2, 4, 5],
+    )
+    assert_frame_equal(filter_values, expected)
+    assert move_df.len() == 6
+
+    filter_out_values = filters.by_datetime(
+        move_df,
+        start_datetime='2008-10-23 05:53:06',
+        end_datetime='2008-10-23 05:55:16',
+        filter_out=True
+    )
+    expected = DataFrame(
+        data=[
+            [39.984093, 116.319237, Timestamp('2008-10-23 05:53:05'), 1],
+            [39.984219, 116.319420, Timestamp('2008-10-23 05:56:21'), 1],
+        ],
+        columns=cols,
+        index=[0, 3],
+    )
+    assert_frame_equal(filter_out_values, expected)
+    assert move_df.len() == 6
+
+    try:
+        filters.by_datetime(
+            move_df, start_datetime=Timestamp('2008-10-23 05:53:06', tz='UTC')
+        )
+        raise AssertionError(
+            'TypeError error not raised by by_datetime'
+        )
+    except TypeError:
+        pass
+
+
 def test_by_label():
     move_df, cols = _prepare_df_default(list_data_1)
 
@@ -612,6 +677,89 @@ def test_by_tid():
     assert move_df.len() == 2
 
 
+def test_clean_consecutive_duplicates():
+    move_df, cols = _prepare_df_default(list_data_1)
+
+    filter_values = filters.clean_consecutive_duplicates(move_df)
+    expected = DataFrame(
+        data=[
+            [
+                39.984092712402344,
+                116.31923675537101,
+                Timestamp('2008-10-23 05:53:05'),
+                1,
+            ],
+            [
+                39.984199952392578,
+                116.31932067871094,
+                Timestamp('2008-10-23 05:53:06'),
+                1,
+            ],
+            [
+                39.984222412109375,
+                116.31940460205078,
+                Timestamp('2008-10-23 05:53:11'),
+                2,
+            ],
+        ],
+        columns=cols,
+        index=[0, 1, 2],
+    )
+    assert_frame_equal(filter_values, expected)
+    assert move_df.len() == 4
+
+    filter_values = filters.clean_consecutive_duplicates(
+        move_df, subset=[TRAJ_ID], keep='last'
+    )
+    expected = DataFrame(
+        data=[
+            [
+                39.984199952392578,
+                116.31932067871094,
+                Timestamp('2008-10-23 05:53:06'),
+                1,
+            ],
+            [
+                39.984222412109375,
+                116.31940460205078,
+                Timestamp('2008-10-23 05:53:11'),
+                2,
+            ],
+        ],
+        columns=cols,
+        index=[1, 3],
+    )
+    assert_frame_equal(filter_values, expected)
+    assert move_df.len() == 4
+
+    filters.clean_consecutive_duplicates(move_df, subset=TRAJ_ID, inplace=True)
+    expected = DataFrame(
+        data=[
+            [
+                39.984092712402344,
+                116.31923675537101,
+                Timestamp('2008-10-23 05:53:05'),
+                1,
+            ],
+            [
+                39.984222412109375,
+                116.31940460205078,
+                Timestamp('2008-10-23 05:53:11'),
+                2,
+            ],
+        ],
+        columns=cols,
+        index=[0, 2],
+    )
+    assert_frame_equal(move_df, expected)
+    assert move_df.len() == 2
+
+    df = DataFrame({'label': [None, None, 'a', 'a', 'b']})
+    filter_values = filters.clean_consecutive_duplicates(df)
+    expected = DataFrame({'label': [None, None, 'a', 'b']}, index=[0, 1, 2, 4])
+    assert_frame_equal(filter_values, expected)
+
+
 def test_clean_gps_jumps_by_distance():
     move_df, cols = _prepare_df_with_distances()
 
@@ -279,7 +279,27 @@ expected_knn_medt_data = [[16.4, -54.9, Timestamp('2014-10-11 18:00:00'),
                           [13.3, -59.9, Timestamp('2012-08-11 18:00:00'),
                           '             HELENE'],
                           [13.5, -61.4, Timestamp('2012-08-12 00:00:00'),
-                          '             HELENE']]
+                          '             HELENE'],
+                          [11.6, -46.7, Timestamp('2012-08-01 12:00:00'),
+                          '            ERNESTO'],
+                          [12.0, -48.2, Timestamp('2012-08-01 18:00:00'),
+                          '            ERNESTO'],
+                          [12.4, -49.9, Timestamp('2012-08-02 00:00:00'),
+                          '            ERNESTO'],
+                          [12.7, -51.7, Timestamp('2012-08-02 06:00:00'),
+                          '            ERNESTO'],
+                          [13.0, -53.6, Timestamp('2012-08-02 12:00:00'),
+                          '            ERNESTO'],
+                          [13.2, -55.5, Timestamp('2012-08-02 18:00:00'),
+                          '            ERNESTO'],
+                          [13.4, -57.5, Timestamp('2012-08-03 00:00:00'),
+                          '            ERNESTO'],
+                          [13.6, -59.7, Timestamp('2012-08-03 06:00:00'),
+                          '            ERNESTO'],
+                          [13.7, -61.6, Timestamp('2012-08-03 12:00:00'),
+                          '            ERNESTO'],
+                          [13.8, -63.3, Timestamp('2012-08-03 18:00:00'),
+                          '            ERNESTO']]
 
 
 def _default_traj_df(data=None):
@@ -326,6 +346,11 @@ def test_range_query():
     medt_move_df = query.range_query(traj_df, move_df, min_dist=700, distance='MEDT')
     assert_frame_equal(medt_move_df, expected_medt)
 
+    medp_move_df = query.range_query(
+        traj_df, move_df, min_dist=100, distance='MEDP', n_jobs=2
+    )
+    assert_frame_equal(medp_move_df, expected_medp)
+
 
 def test_knn_query():
     traj_df = _default_traj_df()
@@ -340,7 +365,9 @@ def test_knn_query():
     expected_medt = DataFrame(
         data=expected_knn_medt_data,
         columns=['lat', 'lon', 'datetime', 'id'],
-        index=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 30, 31, 32, 33, 34, 35, 36, 37, 38]
+        index=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 30, 31, 32,
+               33, 34, 35, 36, 37, 38, 20, 21, 22, 23,
+               24, 25, 26, 27, 28, 29]
     )
 
     medp_move_df = query.knn_query(traj_df, move_df, k=2, distance='MEDP')
@@ -348,3 +375,13 @@ def test_knn_query():
 
     medt_move_df = query.knn_query(traj_df, move_df, k=2, distance='MEDT')
     assert_frame_equal(medt_move_df, expected_medt)
+
+    medt_move_df = query.knn_query(
+        traj_df, move_df, k=2, distance='MEDT', n_jobs=2
+    )
+    assert_frame_equal(medt_move_df, expected_medt)
+
+    medt_move_df = query.knn_query(
+        traj_df, move_df, k=2, distance='MEDT', n_jobs=8
+    )
+    assert_frame_equal(medt_move_df, expected_medt)